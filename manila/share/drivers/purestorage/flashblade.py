@@ -21,20 +21,23 @@ import platform
 
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import importutils
 from oslo_utils import units
 
 from manila import exception
 from manila.i18n import _
 from manila.share import driver
 
-HAS_PURITY_FB = True
-try:
-    import purity_fb
-except ImportError:
-    purity_fb = None
+# purity_fb is heavy to import, so defer it until a FlashBlade backend
+# is actually set up, see _import_purity_fb()
+purity_fb = None
+# platform.platform() result, computed once, see _get_platform()
+_PLATFORM = None
 
 LOG = logging.getLogger(__name__)
 
+_GIB = units.Gi
+
 flashblade_connection_opts = [
     cfg.HostAddressOpt(
         "flashblade_mgmt_vip",
@@ -75,6 +78,36 @@ CONF.register_opts(flashblade_auth_opts)
 CONF.register_opts(flashblade_extra_opts)
 
 
+def _import_purity_fb():
+    """Import purity_fb on first use, returns None if it is missing"""
+    global purity_fb
+    if purity_fb is None:
+        purity_fb = importutils.try_import("purity_fb")
+    return purity_fb
+
+
+def _get_platform():
+    global _PLATFORM
+    if _PLATFORM is None:
+        _PLATFORM = platform.platform()
+    return _PLATFORM
+
+
+def _is_not_found(ex):
+    """Tell whether a purity_fb ApiException reports a missing object
+
+    Pure REST 1.x APIs report a missing object as a 400 whose error body
+    says it "does not exist" rather than as a 404, so match either form.
+    """
+    status = getattr(ex, "status", None)
+    if status == 404:
+        return True
+    body = getattr(ex, "body", None) or ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    return status == 400 and "does not exist" in body
+
+
 def purity_fb_to_manila_exceptions(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -92,6 +125,7 @@ class FlashBladeShareDriver(driver.ShareDriver):
 
     VERSION = "2.0"  # driver version
     USER_AGENT_BASE = "OpenStack Manila"
+    REST_POOL_MAXSIZE = 16  # idle connections kept to the management VIP
 
     def __init__(self, *args, **kwargs):
         super(FlashBladeShareDriver, self).__init__(False, *args, **kwargs)
@@ -102,12 +136,12 @@ class FlashBladeShareDriver(driver.ShareDriver):
             "base": self.USER_AGENT_BASE,
             "class": self.__class__.__name__,
             "version": self.VERSION,
-            "platform": platform.platform(),
+            "platform": _get_platform(),
         }
 
     def do_setup(self, context):
         """Driver initialization"""
-        if purity_fb is None:
+        if _import_purity_fb() is None:
             msg = _(
                 "Missing 'purity_fb' python module, ensure the library"
                 " is installed and available."
@@ -123,6 +157,20 @@ class FlashBladeShareDriver(driver.ShareDriver):
         )
         self._sys = purity_fb.PurityFb(self.management_address)
         self._sys.disable_verify_ssl()
+        # purity_fb keeps only 4 idle connections per host by default, so
+        # concurrent share operations would keep re-doing TLS handshakes.
+        # Drop the pool opened for version negotiation so the new size
+        # applies to the one used from now on.
+        try:
+            pool_manager = self._sys._api_client.rest_client.pool_manager
+            pool_manager.connection_pool_kw["maxsize"] = self.REST_POOL_MAXSIZE
+            pool_manager.clear()
+        except AttributeError as ex:
+            LOG.debug(
+                "Could not resize purity_fb connection pool, using the "
+                "default: %(err)s",
+                {"err": ex},
+            )
         try:
             self._sys.login(self.api)
             self._sys._api_client.user_agent = self._user_agent
@@ -158,9 +206,9 @@ class FlashBladeShareDriver(driver.ShareDriver):
             storage_protocol="NFS",
             data_reduction=data_reduction,
             reserved_percentage=reserved_share_percentage,
-            total_capacity_gb=float(physical_capacity_bytes) / units.Gi,
-            free_capacity_gb=float(free_capacity_bytes) / units.Gi,
-            provisioned_capacity_gb=float(provisioned_cap_bytes) / units.Gi,
+            total_capacity_gb=float(physical_capacity_bytes) / _GIB,
+            free_capacity_gb=float(free_capacity_bytes) / _GIB,
+            provisioned_capacity_gb=float(provisioned_cap_bytes) / _GIB,
             snapshot_support=True,
             create_share_from_snapshot_support=False,
             mount_snapshot_support=False,
@@ -209,16 +257,18 @@ class FlashBladeShareDriver(driver.ShareDriver):
         )
 
     def _get_flashblade_filesystem_by_name(self, name):
-        filesys = []
-        filesys.append(name)
         try:
-            res = self._sys.file_systems.list_file_systems(names=filesys)
+            res = self._sys.file_systems.list_file_systems(
+                names=[name], limit=1
+            )
         except purity_fb.rest.ApiException as ex:
             msg = _("Share not found on FlashBlade: %s\n") % ex
             LOG.exception(msg)
             raise exception.ManilaException(message=msg)
+        filesystem = res.items[0]
         message = "Filesystem %(share_name)s exists. Continuing..."
-        LOG.debug(message, {"share_name": res.items[0].name})
+        LOG.debug(message, {"share_name": filesystem.name})
+        return filesystem
 
     def _get_flashblade_snapshot_by_name(self, name):
         try:
@@ -245,18 +295,16 @@ class FlashBladeShareDriver(driver.ShareDriver):
     @purity_fb_to_manila_exceptions
     def _resize_share(self, share, new_size):
         dataset_name = self._make_share_name(share)
-        self._get_flashblade_filesystem_by_name(dataset_name)
-        consumed_size = (
-            self._sys.file_systems.list_file_systems(names=[dataset_name])
-            .items[0]
-            .space.virtual
-        )
+        consumed_size = self._get_flashblade_filesystem_by_name(
+            dataset_name
+        ).space.virtual
+        new_size_bytes = new_size * _GIB
         attr = {}
-        if consumed_size >= new_size * units.Gi:
+        if consumed_size >= new_size_bytes:
             raise exception.ShareShrinkingPossibleDataLoss(
                 share_id=share["id"]
             )
-        attr["provisioned"] = new_size * units.Gi
+        attr["provisioned"] = new_size_bytes
         n_attr = purity_fb.FileSystem(**attr)
         LOG.debug("Resizing filesystem...")
         self._sys.file_systems.update_file_systems(
@@ -265,25 +313,23 @@ class FlashBladeShareDriver(driver.ShareDriver):
 
     def _update_nfs_access(self, share, access_rules):
         dataset_name = self._make_share_name(share)
-        self._get_flashblade_filesystem_by_name(dataset_name)
-        nfs_rules = ""
+        ip_rules = []
         rule_state = {}
         for access in access_rules:
             if access["access_type"] == "ip":
-                line = (
-                    access["access_to"]
-                    + "("
-                    + access["access_level"]
-                    + ",no_root_squash) "
-                )
+                ip_rules.append(access)
                 rule_state[access["access_id"]] = {"state": "active"}
-                nfs_rules += line
             else:
                 message = _(
                     'Only "ip" access type is allowed for NFS protocol.'
                 )
                 LOG.error(message)
                 rule_state[access["access_id"]] = {"state": "error"}
+        nfs_rules = " ".join(
+            "%s(%s,no_root_squash)"
+            % (access["access_to"], access["access_level"])
+            for access in ip_rules
+        )
         try:
             self._sys.file_systems.update_file_systems(
                 name=dataset_name,
@@ -304,7 +350,7 @@ class FlashBladeShareDriver(driver.ShareDriver):
     @purity_fb_to_manila_exceptions
     def create_share(self, context, share, share_server=None):
         """Create a share and export it based on protocol used."""
-        size = share["size"] * units.Gi
+        size = share["size"] * _GIB
         share_name = self._make_share_name(share)
 
         if share["share_proto"] == "NFS":
@@ -332,12 +378,11 @@ class FlashBladeShareDriver(driver.ShareDriver):
 
     def create_snapshot(self, context, snapshot, share_server=None):
         """Called to create a snapshot"""
-        source = []
         flashblade_filesystem = self._make_source_name(snapshot)
-        source.append(flashblade_filesystem)
         try:
             self._sys.file_system_snapshots.create_file_system_snapshots(
-                sources=source, suffix=purity_fb.SnapshotSuffix(snapshot["id"])
+                sources=[flashblade_filesystem],
+                suffix=purity_fb.SnapshotSuffix(snapshot["id"]),
             )
         except purity_fb.rest.ApiException as ex:
             msg = (
@@ -346,28 +391,33 @@ class FlashBladeShareDriver(driver.ShareDriver):
             LOG.exception(msg)
             raise exception.ManilaException(message=msg)
 
+    @purity_fb_to_manila_exceptions
     def delete_share(self, context, share, share_server=None):
         """Called to delete a share"""
         dataset_name = self._make_share_name(share)
+        file_systems = self._sys.file_systems
         try:
-            self._get_flashblade_filesystem_by_name(dataset_name)
-        except purity_fb.rest.ApiException:
+            file_systems.update_file_systems(
+                name=dataset_name,
+                attributes=purity_fb.FileSystem(
+                    nfs=purity_fb.NfsRule(
+                        v3_enabled=False, v4_1_enabled=False
+                    ),
+                    smb=purity_fb.ProtocolRule(enabled=False),
+                    destroyed=True,
+                ),
+            )
+        except purity_fb.rest.ApiException as ex:
+            if not _is_not_found(ex):
+                raise
             message = (
                 "share %(dataset_name)s not found on FlashBlade, skip "
                 "delete"
             )
             LOG.warning(message, {"dataset_name": dataset_name})
             return
-        self._sys.file_systems.update_file_systems(
-            name=dataset_name,
-            attributes=purity_fb.FileSystem(
-                nfs=purity_fb.NfsRule(v3_enabled=False, v4_1_enabled=False),
-                smb=purity_fb.ProtocolRule(enabled=False),
-                destroyed=True,
-            ),
-        )
         if self.configuration.flashblade_eradicate:
-            self._sys.file_systems.delete_file_systems(name=dataset_name)
+            file_systems.delete_file_systems(name=dataset_name)
             LOG.info(
                 "FlashBlade eradicated share %(name)s", {"name": dataset_name}
             )
@@ -376,35 +426,36 @@ class FlashBladeShareDriver(driver.ShareDriver):
     def delete_snapshot(self, context, snapshot, share_server=None):
         """Called to delete a snapshot"""
         dataset_name = self._make_source_name(snapshot)
-        filt = "source_display_name='{0}' and suffix='{1}'".format(
-            dataset_name, snapshot["id"]
-        )
         name = "{0}.{1}".format(dataset_name, snapshot["id"])
-        LOG.debug("FlashBlade filter %(name)s", {"name": filt})
+        snapshots = self._sys.file_system_snapshots
         try:
-            self._get_flashblade_snapshot_by_name(filt)
-        except exception.ShareResourceNotFound:
+            snapshots.update_file_system_snapshots(
+                name=name,
+                attributes=purity_fb.FileSystemSnapshot(destroyed=True),
+            )
+        except purity_fb.rest.ApiException as ex:
+            if not _is_not_found(ex):
+                raise
             message = (
                 "snapshot %(snapshot)s not found on FlashBlade, skip delete"
             )
-            LOG.warning(
-                message, {"snapshot": dataset_name + "." + snapshot["id"]}
-            )
+            LOG.warning(message, {"snapshot": name})
             return
-        self._sys.file_system_snapshots.update_file_system_snapshots(
-            name=name, attributes=purity_fb.FileSystemSnapshot(destroyed=True)
-        )
-        LOG.debug(
-            "Snapshot %(name)s deleted successfully",
-            {"name": dataset_name + "." + snapshot["id"]},
-        )
+        LOG.debug("Snapshot %(name)s deleted successfully", {"name": name})
         if self.configuration.flashblade_eradicate:
-            self._sys.file_system_snapshots.delete_file_system_snapshots(
-                name=name
-            )
+            try:
+                snapshots.delete_file_system_snapshots(name=name)
+            except purity_fb.rest.ApiException as ex:
+                if not _is_not_found(ex):
+                    raise
+                message = (
+                    "snapshot %(snapshot)s was destroyed but disappeared "
+                    "before it could be eradicated"
+                )
+                LOG.warning(message, {"snapshot": name})
+                return
             LOG.debug(
-                "Snapshot %(name)s eradicated successfully",
-                {"name": dataset_name + "." + snapshot["id"]},
+                "Snapshot %(name)s eradicated successfully", {"name": name}
             )
 
     def ensure_share(self, context, share, share_server=None):